@@ -15,42 +15,89 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import collections
+import errno
+import json
+import logging
 import socket
 import re
 import selectors
 import os
-import pickle
+import signal
+import sys
 from threading import Thread
 import time
 
-
-def safe_send(conn, msg):
+# Bytes read per recv call
+RECV_SIZE = 1 << 16
+# Kernel send/receive buffer size for backend sockets
+SOCKET_BUFFER_SIZE = 1 << 20
+# Idle backend connections kept open per process, ready for new clients (0 disables)
+BACKEND_POOL_SIZE = 0
+# Seconds before replacing pooled connections the backend closed while idle
+POOL_RETRY_DELAY = 1.0
+# connect_ex() results of a non-blocking connect that is still in progress
+_CONNECT_PENDING = (0, errno.EINPROGRESS, errno.EWOULDBLOCK,
+                    getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))
+# Zero-copy forwarding through a pipe with splice(2), Linux only
+HAVE_SPLICE = hasattr(os, 'splice')
+SPLICE_FLAGS = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK if HAVE_SPLICE else 0
+# Several worker processes sharing the port. Only Linux balances connections
+# between SO_REUSEPORT sockets, macOS and the BSDs hand them all to one
+HAVE_REUSEPORT = sys.platform.startswith('linux') and hasattr(socket, 'SO_REUSEPORT')
+# Pinning workers to CPUs, Linux only
+HAVE_AFFINITY = hasattr(os, 'sched_setaffinity')
+# Start of an HTTP/1.x request, only such a chunk can carry request headers
+_REQUEST_LINE_RE = re.compile(br'[A-Z]+ [^ \r\n]+ HTTP/1\.[01]\r\n')
+# Request header asking to switch the connection to another protocol
+_UPGRADE_RE = re.compile(br'\r\nupgrade:', re.IGNORECASE)
+# Server response accepting the switch
+_SWITCHING_RE = re.compile(br'HTTP/1\.[01] 101[ \r]')
+# Errors meaning the other end went away, not worth reporting as failures
+_CONN_ERRS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+log = logging.getLogger(__name__)
+
+
+def set_buffer_sizes(sock, size):
     """
-    Safely send data to a socket, handling blocking IO errors
-    For non-blocking sockets, wait until socket is ready for writing
+    Set fixed kernel socket buffer sizes
+    Note that on Linux this turns off buffer autotuning for the socket.
     """
-    if not msg:
-        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
 
-    print(f"Sending {len(msg)} bytes")
 
-    try:
-        msg_len = len(msg)
-        totalsent = 0
+def set_low_latency(sock):
+    """Disable Nagle's algorithm so small writes go out immediately"""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
-        while totalsent < msg_len:
-            try:
-                # Try to send data
-                sent = conn.send(msg[totalsent:])
-                if sent == 0:
-                    raise RuntimeError("socket connection broken")
-                totalsent += sent
-            except BlockingIOError:
-                # Socket not ready for writing, wait briefly
-                time.sleep(0.001)
-                continue
-    except Exception as e:
-        print(f"Error in safe_send: {e}")
+
+def make_host_rewriter(port):
+    """
+    Build a function replacing '[ipv6]:port' in client data with localhost
+    Pattern and replacement are bound in the closure, so the per-chunk call
+    does no attribute lookups. The returned function takes a memoryview
+    receive buffer and the received length and returns the data to forward.
+    """
+    port = str(port).encode()
+    # Bounded to an IPv6 literal (optionally with zone id): linear on any input,
+    # and a stray '[' can never match across lines
+    pattern = re.compile(br'\[[0-9A-Fa-f:.]{2,45}(?:%[0-9A-Za-z._~-]+)?\]:' + port)
+    search = pattern.search
+    sub = pattern.sub
+    replacement = b'127.0.0.1:' + port
+
+    def rewrite(buf, received):
+        # Cheap memchr for '[' first, most chunks never reach the regex
+        raw = buf.obj
+        start = raw.find(b'[', 0, received)
+        if start == -1 or search(raw, start, received) is None:
+            return buf[:received]
+        # Every request on a keep-alive connection carries its own Host header
+        return sub(replacement, buf[:received])
+
+    return rewrite
 
 
 def clear_screen():
@@ -66,7 +113,9 @@ class ReverseProxy(Thread):
     Listens on IPv6 address and forwards traffic to local IPv4 server
     """
 
-    def __init__(self, addr: str = None, port: int = None, standalone: bool = False):
+    def __init__(self, addr: str = None, port: int = None, standalone: bool = False,
+                 workers: int = 1, pool_size: int = BACKEND_POOL_SIZE,
+                 buffer_size: int = None):
         # Address to bind to (host, port)
         self.addr = (addr, port) if addr is not None else None
         # Target port to forward to
@@ -77,84 +126,399 @@ class ReverseProxy(Thread):
         self.sel = None
         # Flag to control proxy running state
         self.running = True
+        # Fixed buffer size for client sockets, None leaves them to kernel autotuning
+        self.buffer_size = buffer_size
+        # Number of processes accepting on the port (Linux, standalone mode only:
+        # forking an embedding application would copy the whole host process)
+        self.workers = workers
+        # PIDs of forked worker processes
+        self._worker_pids = []
+        # In a worker process: PID of the process that forked it
+        self._parent_pid = None
+        # Host header rewriter specialized for the target port
+        self._rewrite = None
+        # Per client socket: last bytes of an Upgrade request whose headers did not end yet
+        self._upgrading = {}
+        # Client sockets whose Upgrade request was sent, waiting for the server's answer
+        self._awaiting_upgrade = set()
+        # Client sockets that switched protocols, their data is no longer HTTP
+        self._passthrough = set()
+        # Per socket: bytes the kernel would not take yet, flushed on EVENT_WRITE
+        self._pending = {}
+        # Per socket: (read fd, write fd) of the pipe splicing data towards it
+        self._pipes = {}
+        # Per socket: bytes still sitting in its pipe, flushed on EVENT_WRITE
+        self._piped = {}
+        # Sockets not read from while their peer still has pending data
+        self._paused = set()
+        # Per socket: the other end of its proxied connection
+        self._peers = {}
+        # Per socket: selector data tuple used for its read events
+        self._handlers = {}
+        # Number of pre-connected backend sockets to keep per process (0 disables the pool)
+        self.pool_size = pool_size
+        # Connected, idle backend sockets handed out to new clients
+        self._backend_pool = collections.deque()
+        # Backend sockets still connecting, added to the pool once connected
+        self._pool_connecting = set()
+        # Whether the pool should be topped up after the current events
+        self._refill_pool = True
+        # time.monotonic() before which the pool is not topped up
+        self._refill_at = 0.0
+        if port is not None:
+            self._rewrite = make_host_rewriter(port)
 
         Thread.__init__(self, name=f'{addr=} {port=}')
         self.daemon = True  # Thread will exit when main program exits
 
     def accept_connection(self, sock):
-        """Accept new client connection and create connection to local server"""
+        """Accept all queued client connections and connect each to local server"""
+        # Drain the whole accept queue per wakeup instead of one connection
+        while True:
+            try:
+                # Accept new client connection
+                client, addr = sock.accept()
+            except BlockingIOError:
+                return
+            except Exception as e:
+                log.error("Error accepting connection: %s", e)
+                return
+
+            server = None
+            try:
+                log.info("New connection from %s", addr)
+                client.setblocking(False)
+                set_low_latency(client)
+
+                # Take a pre-connected backend socket, or connect now if none is left
+                server = self._take_backend()
+
+                self._peers[client] = server
+                self._peers[server] = client
+                if HAVE_SPLICE:
+                    self._pipes[client] = os.pipe()
+                    self._pipes[server] = os.pipe()
+
+                # Register both sockets with selector for reading events
+                # Client data is rewritten on its way to the server, server data is not
+                # Each direction reuses one receive buffer for the connection lifetime,
+                # server data needs none when it is spliced
+                client_buf = memoryview(bytearray(RECV_SIZE))
+                server_buf = None if HAVE_SPLICE else memoryview(bytearray(RECV_SIZE))
+                self._handlers[client] = (self.forward, client, server, True, client_buf)
+                self._handlers[server] = (self.forward, server, client, False, server_buf)
+                self.sel.register(client, selectors.EVENT_READ, self._handlers[client])
+                self.sel.register(server, selectors.EVENT_READ, self._handlers[server])
+
+            except Exception as e:
+                log.error("Error accepting connection: %s", e)
+                if server is None:
+                    client.close()
+                else:
+                    # Also releases the backend socket, pipes and bookkeeping
+                    self.close_connection(client, server)
+
+    def _backend_socket(self):
+        """Create a socket for the local IPv4 server with the proxy's options"""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            # Accept new client connection
-            client, addr = sock.accept()
-            print(f"New connection from {addr}")
-            client.setblocking(False)
+            # Set before connect() so the handshake negotiates a large window
+            set_buffer_sizes(server, SOCKET_BUFFER_SIZE)
+            set_low_latency(server)
+        except OSError:
+            server.close()
+            raise
+        return server
 
-            # Create connection to local IPv4 server
-            server = socket.create_connection(("127.0.0.1", self.port))
+    def _connect_backend(self):
+        """Connect to the local IPv4 server, blocking until the handshake is done"""
+        server = self._backend_socket()
+        try:
+            server.connect(("127.0.0.1", self.port))
+        except OSError:
+            server.close()
+            raise
+        server.setblocking(False)
+        return server
+
+    def _take_backend(self):
+        """Hand out a live pooled backend connection, falling back to a new one"""
+        self._refill_pool = True
+        while self._backend_pool:
+            server = self._backend_pool.popleft()
+            self.sel.unregister(server)
+            try:
+                # An idle connection has nothing to read. Data (e.g. a timeout
+                # response) or an empty read (closed) means it is not reusable
+                server.recv(1, socket.MSG_PEEK)
+            except BlockingIOError:
+                return server
+            except OSError:
+                pass
+            server.close()
+        return self._connect_backend()
+
+    def _fill_backend_pool(self):
+        """
+        Start non-blocking connects until the pool (with pending connects) is full
+        The event loop never waits on a handshake; finished connects are picked
+        up by _pool_connected. A client arriving while the pool is empty still
+        connects synchronously in _take_backend.
+        """
+        self._refill_pool = False
+        while len(self._backend_pool) + len(self._pool_connecting) < self.pool_size:
+            try:
+                server = self._backend_socket()
+            except OSError as e:
+                log.debug("Could not pre-connect to backend: %s", e)
+                break
             server.setblocking(False)
+            err = server.connect_ex(("127.0.0.1", self.port))
+            if err not in _CONNECT_PENDING:
+                # Retried after the next accepted client, not on every loop pass
+                log.debug("Could not pre-connect to backend: %s", os.strerror(err))
+                server.close()
+                break
+            self._pool_connecting.add(server)
+            self.sel.register(server, selectors.EVENT_WRITE, (self._pool_connected, server))
+
+    def _pool_connected(self, server):
+        """Pool a backend socket whose non-blocking connect has finished"""
+        self._pool_connecting.discard(server)
+        err = server.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            log.debug("Could not pre-connect to backend: %s", os.strerror(err))
+            self.sel.unregister(server)
+            server.close()
+            return
+        # Any read event on an idle connection means the backend gave up on it
+        self.sel.modify(server, selectors.EVENT_READ, (self._drop_pooled, server))
+        self._backend_pool.append(server)
+
+    def _drop_pooled(self, server):
+        """
+        Close an idle pooled connection the backend closed or wrote to
+        It is replaced after POOL_RETRY_DELAY, so a backend that closes idle
+        connections right away does not make the proxy reconnect in a loop.
+        """
+        log.debug("Dropping idle backend connection")
+        self._backend_pool.remove(server)
+        self.sel.unregister(server)
+        server.close()
+        self._refill_pool = True
+        self._refill_at = time.monotonic() + POOL_RETRY_DELAY
+
+    def _update_events(self, sock):
+        """Re-register sock for the events its current read/write state needs"""
+        events = 0
+        if sock not in self._paused:
+            events |= selectors.EVENT_READ
+        if sock in self._pending or sock in self._piped:
+            events |= selectors.EVENT_WRITE
+
+        if sock in self.sel.get_map():
+            if events:
+                self.sel.modify(sock, events, self._handlers[sock])
+            else:
+                self.sel.unregister(sock)
+        elif events:
+            self.sel.register(sock, events, self._handlers[sock])
+
+    def safe_send(self, conn, msg):
+        """
+        Send data to a non-blocking socket without waiting on it
+        Whatever the kernel does not take right away is queued and written
+        once the selector reports the socket writable. Until then the peer
+        is not read from, so a slow receiver throttles the sender.
+        """
+        if not msg:
+            return
+
+        log.debug("Sending %d bytes", len(msg))
+
+        if conn in self._pending:
+            # Keep ordering: never send ahead of already queued data
+            self._pending[conn] += msg
+            return
 
-            # Register both sockets with selector for reading events
-            # Client -> read_from_client, Server -> read_from_server
-            self.sel.register(client, selectors.EVENT_READ,
-                              (self.read_from_client, client, server))
-            self.sel.register(server, selectors.EVENT_READ,
-                              (self.read_from_server, client, server))
-
+        try:
+            sent = conn.send(msg)
+        except BlockingIOError:
+            sent = 0
+        if sent == len(msg):
+            return
+
+        self._pending[conn] = bytearray(msg[sent:])
+        self._pause_peer(conn)
+
+    def splice_forward(self, src, dst):
+        """
+        Move up to RECV_SIZE bytes from src to dst inside the kernel
+        Data goes socket -> pipe -> socket and never enters user space.
+        Returns the number of bytes read from src, 0 once src is closed.
+        """
+        wfd = self._pipes[dst][1]
+        received = os.splice(src.fileno(), wfd, RECV_SIZE, flags=SPLICE_FLAGS)
+        if received:
+            self._piped[dst] = received
+            self._drain_pipe(dst)
+        return received
+
+    def _drain_pipe(self, conn):
+        """Splice as much of the pipe towards conn as the socket accepts"""
+        rfd = self._pipes[conn][0]
+        left = self._piped[conn]
+        while left:
+            try:
+                left -= os.splice(rfd, conn.fileno(), left, flags=SPLICE_FLAGS)
+            except BlockingIOError:
+                break
+
+        if left:
+            self._piped[conn] = left
+            if self._peers[conn] not in self._paused:
+                self._pause_peer(conn)
+        else:
+            del self._piped[conn]
+            if self._peers[conn] in self._paused:
+                self._resume_peer(conn)
+
+    def _pause_peer(self, conn):
+        """Watch conn for writability and stop reading its peer meanwhile"""
+        peer = self._peers[conn]
+        self._paused.add(peer)
+        self._update_events(conn)
+        self._update_events(peer)
+
+    def _resume_peer(self, conn):
+        """Backlog of conn drained: stop watching writability, read the peer again"""
+        peer = self._peers[conn]
+        self._paused.discard(peer)
+        self._update_events(conn)
+        self._update_events(peer)
+
+    def _flush(self, conn):
+        """Write queued data to a socket the selector reported writable"""
+        try:
+            if conn in self._piped:
+                self._drain_pipe(conn)
+                return
+
+            pending = self._pending[conn]
+            sent = conn.send(pending)
+        except BlockingIOError:
+            return
+        except _CONN_ERRS:
+            log.debug("Connection lost while flushing")
+            self.close_connection(conn, self._peers[conn])
+            return
         except Exception as e:
-            print(f"Error accepting connection: {e}")
-
-    def read_from_client(self, client, server):
-        """Read data from client, replace IPv6 address with localhost, send to server"""
+            log.error("Error flushing data: %s", e)
+            self.close_connection(conn, self._peers[conn])
+            return
+
+        del pending[:sent]
+        if not pending:
+            del self._pending[conn]
+            self._resume_peer(conn)
+
+    def forward(self, src, dst, rewrite, buf):
+        """
+        Read data from src and send it to dst
+        rewrite is set for the client -> server direction, where the IPv6
+        address in the Host header of every request is replaced until the
+        connection is upgraded to another protocol
+        """
+        side, peer_side = ('Client', 'Server') if rewrite else ('Server', 'Client')
         try:
-            # Read data from client socket
-            data = client.recv(4096)
-            if data:
-                # Replace IPv6 address in HTTP Host header with localhost:port
-                ip6 = re.compile(f'\\[[^]]*]:{self.port}')
-                str_data = data.decode('ISO-8859-1', 'ignore')
-                ipm = ip6.search(str_data)
-                if ipm:
-                    # Replace IPv6 address with 127.0.0.1
-                    str_data = str_data.replace(str_data[ipm.start():ipm.end()],
-                                                f'127.0.0.1:{self.port}')
-                    data = str_data.encode('ISO-8859-1')
-
-                print(f"Client -> Server: {len(data)} bytes")
-                # Forward modified data to server
-                safe_send(server, data)
+            if not rewrite and dst in self._awaiting_upgrade:
+                # First response after an Upgrade request, before it is spliced away
+                self._check_upgrade_response(src, dst)
+            if dst in self._pipes and (not rewrite or src in self._passthrough):
+                # Server data, or client data after an upgrade, is never modified,
+                # splice it kernel side
+                received = self.splice_forward(src, dst)
             else:
-                # Client closed connection (received empty data)
-                print("Client closed connection")
-                self.close_connection(client, server)
-        except (ConnectionResetError, ConnectionAbortedError):
-            print("Client connection lost")
-            self.close_connection(client, server)
-        except Exception as e:
-            print(f"Error reading from client: {e}")
-            self.close_connection(client, server)
+                # Read data into the connection's buffer
+                received = src.recv_into(buf)
+                if rewrite and received and src not in self._passthrough:
+                    data = self._rewrite(buf, received)
+                    self._track_upgrade(src, buf, received)
+                    self.safe_send(dst, data)
+                else:
+                    self.safe_send(dst, buf[:received])
 
-    def read_from_server(self, client, server):
-        """Read data from server and forward to client"""
-        try:
-            # Read data from server socket
-            data = server.recv(4096)
-            if data:
-                print(f"Server -> Client: {len(data)} bytes")
-                # Forward data to client (no modification needed)
-                safe_send(client, data)
+            if received:
+                log.debug("%s -> %s: %d bytes", side, peer_side, received)
             else:
-                # Server closed connection
-                print("Server closed connection")
-                self.close_connection(client, server)
-        except (ConnectionResetError, ConnectionAbortedError):
-            print("Server connection lost")
-            self.close_connection(client, server)
+                # Peer closed connection (received empty data)
+                log.debug("%s closed connection", side)
+                self.close_connection(src, dst)
+        except _CONN_ERRS:
+            log.debug("%s connection lost", side)
+            self.close_connection(src, dst)
         except Exception as e:
-            print(f"Error reading from server: {e}")
-            self.close_connection(client, server)
+            log.error("Error reading from %s: %s", side.lower(), e)
+            self.close_connection(src, dst)
+
+    def _track_upgrade(self, client, buf, received):
+        """
+        Notice a client request asking to upgrade the connection
+        Only the header block of a chunk starting with a request line is
+        searched, so a body mentioning 'Upgrade:' does not count. Once the
+        request's headers ended, the client waits for the server's answer.
+        """
+        raw = buf.obj
+        tail = self._upgrading.pop(client, None)
+        if tail is None:
+            if not _REQUEST_LINE_RE.match(raw, 0, received):
+                return
+            end = raw.find(b'\r\n\r\n', 0, received)
+            if _UPGRADE_RE.search(raw, 0, received if end == -1 else end) is None:
+                return
+            if end == -1:
+                # Headers continue in the next read, remember how this one ended
+                self._upgrading[client] = bytes(buf[received - 3:received])
+                return
+        elif (b'\r\n\r\n' not in tail + bytes(buf[:min(3, received)])
+                and raw.find(b'\r\n\r\n', 0, received) == -1):
+            # The blank line ending the headers may be split across two reads
+            self._upgrading[client] = (tail + bytes(buf[:received]))[-3:]
+            return
+
+        log.debug("Client requested an upgrade, waiting for the server to accept it")
+        self._awaiting_upgrade.add(client)
+
+    def _check_upgrade_response(self, server, client):
+        """
+        Switch a client to passthrough if the server answered its upgrade with 101
+        From then on (WebSocket and the like) the client no longer sends HTTP
+        requests, so there is no Host header left to rewrite. Any other answer
+        leaves the connection as plain HTTP.
+        """
+        try:
+            status = server.recv(13, socket.MSG_PEEK)
+        except BlockingIOError:
+            return
+        self._awaiting_upgrade.discard(client)
+        if _SWITCHING_RE.match(status):
+            log.debug("Server accepted upgrade, passing client data through")
+            self._passthrough.add(client)
 
     def close_connection(self, client, server):
         """Cleanup connection: unregister from selector and close sockets"""
+        for sock in (client, server):
+            self._upgrading.pop(sock, None)
+            self._awaiting_upgrade.discard(sock)
+            self._passthrough.discard(sock)
+            self._pending.pop(sock, None)
+            self._piped.pop(sock, None)
+            self._paused.discard(sock)
+            self._peers.pop(sock, None)
+            self._handlers.pop(sock, None)
+            for fd in self._pipes.pop(sock, ()):
+                os.close(fd)
+
         try:
             self.sel.unregister(client)
         except Exception:
@@ -179,15 +543,22 @@ class ReverseProxy(Thread):
         """Main proxy thread execution"""
         if self.standalone:
             clear_screen()
-            # Try to load configuration from file
-            try:
-                config_file = open('config.txt', 'rb')
-                self.addr = pickle.loads(config_file.read())
-                config_file.close()
-            except FileNotFoundError:
-                pass  # Config file doesn't exist
-            except EOFError:
-                self.addr = None  # Config file is empty
+            # Try to load configuration from file, unless an address was passed in
+            if self.addr is None:
+                try:
+                    config_file = open('config.txt', 'rb')
+                    self.addr = tuple(json.loads(config_file.read()))
+                    config_file.close()
+                    # Saved address was resolved before, only check it is numeric (no DNS)
+                    self.addr = socket.getaddrinfo(
+                        *self.addr, family=socket.AF_INET6, type=socket.SOCK_STREAM,
+                        flags=socket.AI_NUMERICHOST | socket.AI_NUMERICSERV)[0][4][:2]
+                    # Saved address carries the port we forward to
+                    self.port = self.addr[1]
+                except FileNotFoundError:
+                    pass  # Config file doesn't exist
+                except (ValueError, TypeError, socket.gaierror):
+                    self.addr = None  # Config file is empty, not JSON (older versions used pickle) or invalid
 
             # If no config loaded, ask user for configuration
             if not self.addr:
@@ -217,71 +588,145 @@ class ReverseProxy(Thread):
                     elif valid_addrs:
                         self.addr = valid_addrs[0][4][:2]
                     else:
-                        print("No valid IPv6 addresses found!")
+                        log.error("No valid IPv6 addresses found!")
                         return
                 except Exception as e:
-                    print(f"Error getting addresses: {e}")
+                    log.error("Error getting addresses: %s", e)
                     return
 
                 # Ask if user wants to save configuration
                 if input('Do you want to save config for next time?(Y/N)\nEnter: ').upper() == 'Y':
                     try:
                         config_file = open('config.txt', 'wb')
-                        config_file.write(pickle.dumps(self.addr))
+                        config_file.write(json.dumps(list(self.addr)).encode())
                         config_file.close()
                     except Exception as e:
-                        print(f"Error saving config: {e}")
+                        log.error("Error saving config: %s", e)
 
                     clear_screen()
 
             print(f"Reverse Proxy is up and running on [{self.addr[0]}] with port {self.addr[1]}")
+            # Port is only known now, build the Host header rewriter for it
+            self._rewrite = make_host_rewriter(self.port)
+
+        # Fork extra workers only where the kernel can balance between them,
+        # and never inside an application that embeds the proxy thread
+        workers = self.workers if HAVE_REUSEPORT and self.standalone else 1
 
+        # One CPU per worker, keeps each worker's socket state in its own caches
+        cpus = sorted(os.sched_getaffinity(0)) if HAVE_AFFINITY and workers > 1 else []
+
+        try:
+            ipv6side = self._create_listener(reuse_port=workers > 1,
+                                             cpu=cpus[0] if cpus else None)
+        except Exception as e:
+            log.error("Error starting proxy server: %s", e)
+            return
+
+        print(f"Proxy server started successfully on [{self.addr[0]}]:{self.addr[1]}")
+
+        for index in range(1, workers):
+            cpu = cpus[index % len(cpus)] if cpus else None
+            pid = os.fork()
+            if pid == 0:
+                # Worker process: own listener and selector, never returns to the caller
+                try:
+                    self._parent_pid = os.getppid()
+                    ipv6side.close()
+                    if cpu is not None:
+                        os.sched_setaffinity(0, {cpu})
+                    self._serve(self._create_listener(reuse_port=True, cpu=cpu))
+                except Exception as e:
+                    log.error("Error in worker process: %s", e)
+                finally:
+                    os._exit(0)
+            self._worker_pids.append(pid)
+
+        if cpus:
+            os.sched_setaffinity(0, {cpus[0]})
+
+        try:
+            self._serve(ipv6side)
+        finally:
+            self._stop_workers()
+
+    def _create_listener(self, reuse_port=False, cpu=None):
+        """
+        Create the non-blocking IPv6 listening socket
+        With cpu given, the kernel prefers it for connections handled on that CPU
+        """
+        # Create IPv6 listening socket
+        ipv6side = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        # Allow address reuse (helpful for quick restarts)
+        ipv6side.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Every worker binds its own socket, the kernel spreads connections
+            ipv6side.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if cpu is not None and hasattr(socket, 'SO_INCOMING_CPU'):
+            ipv6side.setsockopt(socket.SOL_SOCKET, socket.SO_INCOMING_CPU, cpu)
+        if self.buffer_size:
+            # Set before listen() so accepted sockets inherit it and negotiate
+            # a matching window. Off by default, autotuning usually grows further
+            set_buffer_sizes(ipv6side, self.buffer_size)
+        set_low_latency(ipv6side)
+        # Bind to specified address and port
+        ipv6side.bind(self.addr)
+        # Listen for incoming connections
+        ipv6side.listen(20)
+        # Set non-blocking mode
+        ipv6side.setblocking(False)
+        return ipv6side
+
+    def _serve(self, ipv6side):
+        """Run the event loop for one listening socket until stopped"""
         # Create selector for handling multiple connections
         self.sel = selectors.DefaultSelector()
 
         try:
-            # Create IPv6 listening socket
-            ipv6side = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-            # Allow address reuse (helpful for quick restarts)
-            ipv6side.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            # Bind to specified address and port
-            ipv6side.bind(self.addr)
-            # Listen for incoming connections
-            ipv6side.listen(20)
-            # Set non-blocking mode
-            ipv6side.setblocking(False)
-
             # Register listening socket with selector
-            self.sel.register(ipv6side, selectors.EVENT_READ, self.accept_connection)
-
-            print(f"Proxy server started successfully on [{self.addr[0]}]:{self.addr[1]}")
+            self.sel.register(ipv6side, selectors.EVENT_READ,
+                              (self.accept_connection, ipv6side))
 
             # Main event loop
             while self.running:
                 try:
                     # Wait for socket events with 1 second timeout
                     events = self.sel.select(timeout=1.0)
+                    if self._parent_pid is not None and os.getppid() != self._parent_pid:
+                        # Parent is gone, do not linger as an orphan worker
+                        break
                     for key, mask in events:
-                        callback = key.data
-                        if isinstance(callback, tuple):
-                            # Data handler callback (read_from_client/read_from_server)
-                            callback[0](callback[1], callback[2])
-                        else:
-                            # Connection acceptor callback
-                            callback(key.fileobj)
+                        # Socket may have been closed by an earlier event in this batch
+                        if key.fileobj.fileno() == -1:
+                            continue
+                        if mask & selectors.EVENT_WRITE and key.fileobj in self._peers:
+                            # Socket has room again for its queued data
+                            self._flush(key.fileobj)
+                            if not mask & selectors.EVENT_READ or key.fileobj.fileno() == -1:
+                                continue
+                        # accept_connection, forward or a pool callback, with their arguments
+                        callback, *args = key.data
+                        callback(*args)
+                    if self._refill_pool and time.monotonic() >= self._refill_at:
+                        self._fill_backend_pool()
                 except KeyboardInterrupt:
                     print("\nShutting down...")
                     self.running = False
                     break
                 except Exception as e:
-                    print(f"Error in select loop: {e}")
+                    log.error("Error in select loop: %s", e)
                     time.sleep(1)
 
-        except Exception as e:
-            print(f"Error starting proxy server: {e}")
         finally:
             # Cleanup: close all sockets and selector
             if self.sel:
+                # Proxied connections, including ones paused and not registered
+                for sock, peer in list(self._peers.items()):
+                    self.close_connection(sock, peer)
+                while self._backend_pool:
+                    self._backend_pool.popleft().close()
+                # Pending connects are still registered and closed below
+                self._pool_connecting.clear()
                 for key in list(self.sel.get_map().values()):
                     try:
                         key.fileobj.close()
@@ -289,12 +734,27 @@ class ReverseProxy(Thread):
                         pass
                 self.sel.close()
 
+    def _stop_workers(self):
+        """Terminate and reap forked worker processes"""
+        for pid in self._worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self._worker_pids.clear()
+
 
 if __name__ == '__main__':
+    # Per packet tracing is off unless PROXY_DEBUG is set to e.g. 1 or true
+    debug = os.environ.get('PROXY_DEBUG', '').strip().lower() in ('1', 'true', 'yes', 'on')
+    logging.basicConfig(level=logging.DEBUG if debug else logging.INFO, format='%(message)s')
     try:
         # Create and start proxy in standalone mode
-        p = ReverseProxy(standalone=True)
-        p.start()
-        p.join()
+        p = ReverseProxy(standalone=True, workers=os.cpu_count() or 1,
+                         pool_size=int(os.environ.get('PROXY_POOL_SIZE', BACKEND_POOL_SIZE)))
+        # Run in the main thread, so worker processes are forked from a
+        # single-threaded process
+        p.run()
     except KeyboardInterrupt:
         print("\nProxy server stopped.")